@@ -20,14 +20,20 @@ import json
 import time
 import asyncio
 import aiohttp
+import atexit
 import threading
+import weakref
 import base64
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
-import hashlib
-import string
+from typing import Optional, Dict, Any, Tuple
+import secrets
 import random
 
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖，未安装时回退到标准库json
+    orjson = None
+
 import plugins
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
@@ -35,6 +41,67 @@ from common.log import logger
 from plugins import *
 
 
+if orjson is not None:
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+else:
+    _json_loads = json.loads
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# 配置修改后延迟写入的秒数，期间的多次修改合并为一次写入
+_CONFIG_FLUSH_DELAY = 2.0
+
+def _flush_config_at_exit(plugin_ref):
+    """进程退出时写入插件尚未保存的配置"""
+    plugin = plugin_ref()
+    if plugin is not None:
+        plugin._flush_config()
+
+
+# 二维码登录时使用的设备名称（固定组合，预先生成）
+_DEVICE_NAMES = tuple(
+    f"{first} {last}'s iPad"
+    for first in ("Alice", "Bob", "Charlie", "Diana", "Edward", "Fiona")
+    for last in ("Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia")
+)
+
+
+class AsyncEventLoopThread:
+    """在独立线程中持续运行的事件循环"""
+    
+    def __init__(self, name: str = "AutoSessionWarning:loop"):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+    
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+    
+    def start(self):
+        """启动事件循环线程"""
+        self.thread.start()
+    
+    def is_alive(self) -> bool:
+        return self.thread.is_alive()
+    
+    def submit(self, coro):
+        """将协程提交到事件循环执行，返回concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+    
+    def stop(self, timeout: float = 5):
+        """停止事件循环并等待线程退出"""
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout=timeout)
+        if not self.loop.is_running() and not self.loop.is_closed():
+            self.loop.close()
+
+
 @plugins.register(
     name="auto_session_warning",
     desire_priority=99,
@@ -69,13 +136,51 @@ class AutoSessionWarningPlugin(Plugin):
         
         # 运行状态
         self.is_running = False
-        self.background_thread = None
-        self.last_warning_time = 0
+        self.background_task = None
+        self._stop_event = None
+        self.last_warning_time = None  # 上次预警的time.monotonic()时间
+        
+        # 持久事件循环线程，所有异步任务均在其上执行，随插件销毁而停止
+        self._loop_thread = None
+        
+        # 共享的HTTP会话（在事件循环内惰性创建，复用连接池）
+        self._http_session = None
+        self._http_session_loop = None
+        
+        # 配置延迟写入状态
+        self._config_dirty = False
+        self._config_flush_handle = None
+        self._config_lock = threading.Lock()
+        atexit.register(_flush_config_at_exit, weakref.ref(self))
         
         # 当前微信ID和设备ID（从wx849_device_info.json获取）
         self.current_wxid = ""
         self.current_device_id = ""
         
+        # 项目根目录及相关文件路径（只解析一次）
+        self._root_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self._tmp_dir = os.path.join(self._root_dir, "tmp")
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        self._device_info_path = os.path.join(self._root_dir, "wx849_device_info.json")
+        self._login_stat_paths = [
+            os.path.join(self._root_dir, "lib", "wx849", "WechatAPI", client, "login_stat.json")
+            for client in ("Client", "Client2", "Client3")
+        ]
+        
+        # 设备信息缓存条目（按文件修改时间失效，整体替换以保证数据与登录时间一致）
+        self._device_info_cache = None
+        
+        # 指令分发表：完整指令 -> 处理函数(content, msg)，$预警阈值按前缀匹配
+        self._commands = {
+            "$预警状态": lambda content, msg: self._handle_status_query(),
+            "$预警配置": lambda content, msg: self._handle_config_query(),
+            "$预警启用": lambda content, msg: self._handle_enable_warning(),
+            "$预警禁用": lambda content, msg: self._handle_disable_warning(),
+            "$预警阈值": lambda content, msg: self._handle_threshold_setting(content),
+            "$预警测试": lambda content, msg: self._handle_warning_test(msg, force_logout=False),
+            "$断线重连": lambda content, msg: self._handle_warning_test(msg, force_logout=True),
+        }
+        
         # 注册事件处理器
         self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
         
@@ -103,60 +208,35 @@ class AutoSessionWarningPlugin(Plugin):
         if e_context["context"].type != ContextType.TEXT:
             return
         
-        content = e_context["context"].content.strip()
-        msg = e_context["context"]["msg"]
+        # 非指令消息直接返回，避免对每条消息执行strip
+        raw = e_context["context"].content
+        if "$预警" not in raw and "$断线重连" not in raw:
+            return
+        content = raw.strip()
         
         # 检查是否是预警相关指令
-        if content == "$预警状态":
-            reply = self._handle_status_query()
-            e_context["reply"] = reply
-            e_context.action = EventAction.BREAK_PASS
-            
-        elif content == "$预警配置":
-            reply = self._handle_config_query()
-            e_context["reply"] = reply
-            e_context.action = EventAction.BREAK_PASS
-            
-        elif content == "$预警启用":
-            reply = self._handle_enable_warning()
-            e_context["reply"] = reply
-            e_context.action = EventAction.BREAK_PASS
-            
-        elif content == "$预警禁用":
-            reply = self._handle_disable_warning()
-            e_context["reply"] = reply
-            e_context.action = EventAction.BREAK_PASS
-            
-        elif content.startswith("$预警阈值"):
-            reply = self._handle_threshold_setting(content)
-            e_context["reply"] = reply
-            e_context.action = EventAction.BREAK_PASS
-            
-        elif content == "$预警测试":
-            reply = self._handle_warning_test(msg, force_logout=False)
-            e_context["reply"] = reply
-            e_context.action = EventAction.BREAK_PASS
-            
-        elif content == "$断线重连":
-            reply = self._handle_warning_test(msg, force_logout=True)
-            e_context["reply"] = reply
-            e_context.action = EventAction.BREAK_PASS
-
+        handler = self._commands.get(content)
+        if handler is None and content.startswith("$预警阈值"):
+            handler = self._commands["$预警阈值"]
+        if handler is None:
+            return
+        
+        e_context["reply"] = handler(content, e_context["context"]["msg"])
+        e_context.action = EventAction.BREAK_PASS
     
     def _handle_status_query(self) -> Reply:
         """处理预警状态查询"""
         try:
-            # 获取当前登录信息
-            self._load_current_login_info()
+            # 获取当前登录信息和登录时间
+            wxid, _, login_time = self._refresh_login_state()
             
-            if not self.current_wxid:
+            if not wxid:
                 reply = Reply()
                 reply.type = ReplyType.TEXT
                 reply.content = "❌ 无法获取当前登录信息，请确保微信已正常登录。"
                 return reply
             
-            # 获取登录时间和计算在线时长
-            login_time = self._get_real_login_time()
+            # 计算在线时长
             if not login_time:
                 reply = Reply()
                 reply.type = ReplyType.TEXT
@@ -227,8 +307,7 @@ class AutoSessionWarningPlugin(Plugin):
         """处理启用预警"""
         try:
             self.warning_enabled = True
-            self.config["auto_session_warning_enabled"] = True
-            self.save_config(self.config)
+            self._update_config("auto_session_warning_enabled", True)
             
             # 启动后台检查
             self._start_background_check()
@@ -250,8 +329,7 @@ class AutoSessionWarningPlugin(Plugin):
         """处理禁用预警"""
         try:
             self.warning_enabled = False
-            self.config["auto_session_warning_enabled"] = False
-            self.save_config(self.config)
+            self._update_config("auto_session_warning_enabled", False)
             
             # 停止后台检查
             self._stop_background_check()
@@ -303,8 +381,7 @@ class AutoSessionWarningPlugin(Plugin):
             
             # 更新阈值
             self.warning_threshold = threshold
-            self.config["auto_session_warning_threshold"] = threshold
-            self.save_config(self.config)
+            self._update_config("auto_session_warning_threshold", threshold)
             
             trigger_hours = 72 - threshold
             
@@ -324,20 +401,45 @@ class AutoSessionWarningPlugin(Plugin):
             reply.content = f"❌ 设置阈值失败: {str(e)}"
             return reply
     
+    def _update_config(self, key: str, value):
+        """修改配置项，并延迟合并写入配置文件"""
+        with self._config_lock:
+            self.config[key] = value
+            self._config_dirty = True
+        self._ensure_loop_thread().loop.call_soon_threadsafe(self._arm_config_flush)
+    
+    def _arm_config_flush(self):
+        """重新计时延迟写入（在事件循环线程内执行）"""
+        if self._config_flush_handle is not None:
+            self._config_flush_handle.cancel()
+        self._config_flush_handle = asyncio.get_running_loop().call_later(
+            _CONFIG_FLUSH_DELAY, self._flush_config
+        )
+    
+    def _flush_config(self):
+        """将未保存的配置写入文件"""
+        with self._config_lock:
+            if not self._config_dirty:
+                return
+            self._config_dirty = False
+            try:
+                self.save_config(dict(self.config))
+            except Exception as e:
+                logger.error(f"[AutoSessionWarning] 保存配置失败: {e}")
+    
     def _handle_warning_test(self, msg, force_logout: bool = False) -> Reply:
         """处理预警测试"""
         try:
-            # 获取当前登录信息
-            self._load_current_login_info()
+            # 获取当前登录信息和登录时间
+            wxid, _, login_time = self._refresh_login_state()
             
-            if not self.current_wxid:
+            if not wxid:
                 reply = Reply()
                 reply.type = ReplyType.TEXT
                 reply.content = "❌ 无法获取当前登录信息，请确保微信已正常登录。"
                 return reply
             
-            # 获取登录时间和计算在线时长
-            login_time = self._get_real_login_time()
+            # 计算在线时长
             if not login_time:
                 reply = Reply()
                 reply.type = ReplyType.TEXT
@@ -379,9 +481,7 @@ class AutoSessionWarningPlugin(Plugin):
             
             # 启动异步任务
             target_wxid = msg.from_user_id if hasattr(msg, 'from_user_id') else msg.sender_wxid
-            threading.Thread(
-                target=lambda: asyncio.run(self._force_logout_and_send_qr(target_wxid, force_logout))
-            ).start()
+            self._ensure_loop_thread().submit(self._force_logout_and_send_qr(target_wxid, force_logout))
             
             reply = Reply()
             reply.type = ReplyType.TEXT
@@ -407,13 +507,13 @@ class AutoSessionWarningPlugin(Plugin):
                 logout_success = await self._force_logout()
                 if logout_success:
                     logger.info(f"[AutoSessionWarning] 强制退出登录成功")
-                    await self._send_text_message(to_wxid, "✅ 已强制退出当前登录，正在生成新的登录二维码...")
+                    notice = "✅ 已强制退出当前登录，正在生成新的登录二维码..."
                 else:
                     logger.warning(f"[AutoSessionWarning] 强制退出登录失败，继续发送二维码")
-                    await self._send_text_message(to_wxid, "⚠️ 退出登录失败，但仍将发送登录二维码...")
+                    notice = "⚠️ 退出登录失败，但仍将发送登录二维码..."
                 
-                # 等待2秒确保退出完成
-                await asyncio.sleep(2)
+                # 发送提示的同时等待2秒确保退出完成
+                await asyncio.gather(self._send_text_message(to_wxid, notice), asyncio.sleep(2))
                 
                 # 第2步：生成并发送二维码
                 success = await self._send_login_qr_code(to_wxid)
@@ -427,11 +527,11 @@ class AutoSessionWarningPlugin(Plugin):
                 # 普通测试模式：直接发送二维码
                 logger.info(f"[AutoSessionWarning] 执行普通测试模式")
                 
-                # 等待1秒
-                await asyncio.sleep(1)
+                # 生成二维码的同时等待1秒，确保测试回复先于二维码送达
+                qr_image_path, _ = await asyncio.gather(self._prepare_qr_image(), asyncio.sleep(1))
                 
-                # 直接生成并发送二维码
-                success = await self._send_login_qr_code(to_wxid)
+                # 发送二维码
+                success = bool(qr_image_path) and await self._send_qr_image(to_wxid, qr_image_path)
                 if success:
                     logger.info(f"[AutoSessionWarning] 普通测试二维码发送成功: {to_wxid}")
                     await self._send_text_message(to_wxid, "📱 登录二维码已发送。注意：如果账号未掉线，扫码可能不会更新时间戳。")
@@ -443,6 +543,33 @@ class AutoSessionWarningPlugin(Plugin):
             logger.error(f"[AutoSessionWarning] 测试执行失败: {e}")
             await self._send_text_message(to_wxid, f"❌ 操作失败: {str(e)}")
 
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """获取共享的HTTP会话（惰性创建，会话只在创建它的事件循环内复用）"""
+        loop = asyncio.get_running_loop()
+        if (self._http_session is None or self._http_session.closed
+                or self._http_session_loop is not loop):
+            connector = aiohttp.TCPConnector(
+                limit=10,
+                limit_per_host=4,
+                ttl_dns_cache=300,
+                use_dns_cache=True,
+                keepalive_timeout=60
+            )
+            timeout = aiohttp.ClientTimeout(total=30, connect=5, sock_read=25)
+            self._http_session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            self._http_session_loop = loop
+        return self._http_session
+    
+    async def _close_session(self):
+        """关闭共享的HTTP会话（只关闭属于当前事件循环的会话）"""
+        session = self._http_session
+        if session is None or self._http_session_loop is not asyncio.get_running_loop():
+            return
+        self._http_session = None
+        self._http_session_loop = None
+        if not session.closed:
+            await session.close()
+    
     async def _force_logout(self) -> bool:
         """强制退出当前登录"""
         try:
@@ -450,30 +577,30 @@ class AutoSessionWarningPlugin(Plugin):
                 logger.warning("[AutoSessionWarning] 无当前wxid，无法退出登录")
                 return False
             
-            async with aiohttp.ClientSession() as session:
-                url = f"{self.base_url}/Login/Logout"
-                json_param = {
-                    "wxid": self.current_wxid,
-                    "Wxid": self.current_wxid  # 提供兼容性
-                }
+            session = await self._get_session()
+            url = f"{self.base_url}/Login/Logout"
+            json_param = {
+                "wxid": self.current_wxid,
+                "Wxid": self.current_wxid  # 提供兼容性
+            }
                 
-                logger.info(f"[AutoSessionWarning] 正在强制退出登录: {self.current_wxid}")
+            logger.info(f"[AutoSessionWarning] 正在强制退出登录: {self.current_wxid}")
                 
-                async with session.post(url, json=json_param, timeout=10) as response:
-                    if response.status != 200:
-                        logger.error(f"[AutoSessionWarning] 退出登录HTTP失败: {response.status}")
-                        return False
+            async with session.post(url, data=_json_dumps(json_param), headers=_JSON_HEADERS) as response:
+                if response.status != 200:
+                    logger.error(f"[AutoSessionWarning] 退出登录HTTP失败: {response.status}")
+                    return False
                     
-                    result = await response.json()
-                    success = result.get("Success", False)
+                result = await response.json(loads=_json_loads)
+                success = result.get("Success", False)
                     
-                    if success:
-                        logger.info(f"[AutoSessionWarning] 强制退出登录成功: {self.current_wxid}")
-                        return True
-                    else:
-                        error_msg = result.get("Message", "未知错误")
-                        logger.error(f"[AutoSessionWarning] 强制退出登录失败: {error_msg}")
-                        return False
+                if success:
+                    logger.info(f"[AutoSessionWarning] 强制退出登录成功: {self.current_wxid}")
+                    return True
+                else:
+                    error_msg = result.get("Message", "未知错误")
+                    logger.error(f"[AutoSessionWarning] 强制退出登录失败: {error_msg}")
+                    return False
                         
         except Exception as e:
             logger.error(f"[AutoSessionWarning] 强制退出登录异常: {e}")
@@ -494,147 +621,195 @@ class AutoSessionWarningPlugin(Plugin):
         except Exception as e:
             logger.error(f"[AutoSessionWarning] 延迟发送二维码失败: {e}")
     
-    def _load_current_login_info(self):
-        """从wx849_device_info.json文件加载当前登录信息"""
+    def _read_device_info(self) -> Optional[Dict[str, Any]]:
+        """读取wx849_device_info.json，文件未变化时直接返回缓存条目
+        
+        条目包含data（文件内容）及由其解析出的login_ts、login_time_dt
+        """
+        path = self._device_info_path
         try:
-            device_info_path = os.path.join(
-                os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 
-                "wx849_device_info.json"
-            )
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        
+        entry = self._device_info_cache
+        if (entry is not None and entry["path"] == path
+                and entry["mtime"] == st.st_mtime_ns and entry["size"] == st.st_size):
+            return entry
+        
+        with open(path, "rb") as f:
+            data = _json_loads(f.read())
+        
+        # 登录时间随文件一起缓存，文件未变化时无需重复构造datetime
+        login_ts, login_time_dt = self._parse_login_time(data)
+        entry = {
+            "mtime": st.st_mtime_ns,
+            "size": st.st_size,
+            "path": path,
+            "data": data,
+            "login_ts": login_ts,
+            "login_time_dt": login_time_dt
+        }
+        self._device_info_cache = entry
+        return entry
+    
+    def _parse_login_time(self, info: Any) -> Tuple[float, Optional[datetime]]:
+        """解析login_time字段，返回(时间戳, datetime)，无效时返回(0, None)"""
+        login_ts = info.get("login_time", 0) if isinstance(info, dict) else 0
+        if isinstance(login_ts, bool) or not isinstance(login_ts, (int, float)) or login_ts <= 0:
+            return 0, None
+        try:
+            return login_ts, datetime.fromtimestamp(login_ts)
+        except (OverflowError, OSError, ValueError) as e:
+            logger.warning(f"[AutoSessionWarning] 登录时间无效: {login_ts}, {e}")
+            return 0, None
+    
+    def _refresh_login_state(self) -> Tuple[str, str, Optional[datetime]]:
+        """一次读取设备信息，刷新登录信息并返回(wxid, device_id, login_time)"""
+        device_info = self._load_current_login_info()
+        login_time = self._get_real_login_time(device_info)
+        return self.current_wxid, self.current_device_id, login_time
+    
+    def _load_current_login_info(self) -> Optional[Dict[str, Any]]:
+        """从wx849_device_info.json文件加载当前登录信息，返回读取到的缓存条目"""
+        device_info = None
+        try:
+            device_info = self._read_device_info()
             
-            if os.path.exists(device_info_path):
-                with open(device_info_path, "r", encoding="utf-8") as f:
-                    device_info = json.load(f)
-                
-                self.current_wxid = device_info.get("wxid", "")
-                self.current_device_id = device_info.get("device_id", "")
+            if device_info is not None:
+                self.current_wxid = device_info["data"].get("wxid", "")
+                self.current_device_id = device_info["data"].get("device_id", "")
                 
                 logger.debug(f"[AutoSessionWarning] 已加载登录信息: wxid={self.current_wxid}")
             else:
-                logger.warning(f"[AutoSessionWarning] 设备信息文件不存在: {device_info_path}")
+                logger.warning(f"[AutoSessionWarning] 设备信息文件不存在: {self._device_info_path}")
                 
         except Exception as e:
             logger.error(f"[AutoSessionWarning] 加载登录信息失败: {e}")
+        
+        return device_info
     
-    def _get_real_login_time(self) -> Optional[datetime]:
-        """获取真正的登录时间"""
-        try:
-            # 优先从wx849_device_info.json获取
-            device_info_path = os.path.join(
-                os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 
-                "wx849_device_info.json"
-            )
-            
-            if os.path.exists(device_info_path):
-                with open(device_info_path, "r", encoding="utf-8") as f:
-                    device_info = json.load(f)
+    def _lookup_login_time(self, device_info: Optional[Dict[str, Any]] = None) -> Tuple[float, Optional[datetime]]:
+        """获取登录时间(时间戳, datetime)，可传入_read_device_info返回的条目以避免重复读取"""
+        # 优先从wx849_device_info.json获取
+        if device_info is None:
+            device_info = self._read_device_info()
+        
+        if device_info is not None and device_info["login_time_dt"] is not None:
+            logger.debug(f"[AutoSessionWarning] 获取到登录时间: {device_info['login_time_dt']}")
+            return device_info["login_ts"], device_info["login_time_dt"]
+        
+        # 回退方案：从login_stat.json获取
+        for path in self._login_stat_paths:
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    login_stat = _json_loads(f.read())
                 
-                login_time_timestamp = device_info.get("login_time", 0)
-                if login_time_timestamp > 0:
-                    login_time = datetime.fromtimestamp(login_time_timestamp)
-                    logger.debug(f"[AutoSessionWarning] 获取到登录时间: {login_time}")
-                    return login_time
-            
-            # 回退方案：从login_stat.json获取
-            possible_paths = [
-                os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 
-                           "lib", "wx849", "WechatAPI", "Client", "login_stat.json"),
-                os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 
-                           "lib", "wx849", "WechatAPI", "Client2", "login_stat.json"),
-                os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 
-                           "lib", "wx849", "WechatAPI", "Client3", "login_stat.json"),
-            ]
-            
-            for path in possible_paths:
-                if os.path.exists(path):
-                    with open(path, "r", encoding="utf-8") as f:
-                        login_stat = json.load(f)
-                    
-                    login_time_timestamp = login_stat.get("login_time", 0)
-                    if login_time_timestamp > 0:
-                        login_time = datetime.fromtimestamp(login_time_timestamp)
-                        logger.debug(f"[AutoSessionWarning] 从备用路径获取登录时间: {login_time}")
-                        return login_time
-            
-            logger.warning("[AutoSessionWarning] 无法获取登录时间")
-            return None
+                login_ts, login_time = self._parse_login_time(login_stat)
+                if login_time is not None:
+                    logger.debug(f"[AutoSessionWarning] 从备用路径获取登录时间: {login_time}")
+                    return login_ts, login_time
+        
+        return 0, None
+    
+    def _get_real_login_time(self, device_info: Optional[Dict[str, Any]] = None) -> Optional[datetime]:
+        """获取真正的登录时间，可传入已读取的设备信息条目以避免重复读取"""
+        try:
+            _, login_time = self._lookup_login_time(device_info)
+            if login_time is None:
+                logger.warning("[AutoSessionWarning] 无法获取登录时间")
+            return login_time
             
         except Exception as e:
             logger.error(f"[AutoSessionWarning] 获取登录时间失败: {e}")
             return None
     
+    def _get_login_timestamp(self) -> float:
+        """获取登录时间戳（秒），无法获取时返回0"""
+        login_ts, _ = self._lookup_login_time()
+        return login_ts
+    
     async def _send_login_qr_code(self, to_wxid: str) -> bool:
         """生成并发送登录二维码"""
+        qr_image_path = await self._prepare_qr_image()
+        if not qr_image_path:
+            return False
+        return await self._send_qr_image(to_wxid, qr_image_path)
+    
+    async def _prepare_qr_image(self) -> Optional[str]:
+        """获取登录二维码并下载到临时文件，返回图片路径"""
         try:
             # 生成设备信息
             device_id = self._create_device_id()
             device_name = self._create_device_name()
             
             # 获取二维码
-            async with aiohttp.ClientSession() as session:
-                url = f"{self.base_url}/Login/GetQR"
-                json_param = {
-                    "DeviceName": device_name,
-                    "DeviceID": device_id
-                }
+            session = await self._get_session()
+            url = f"{self.base_url}/Login/GetQR"
+            json_param = {
+                "DeviceName": device_name,
+                "DeviceID": device_id
+            }
                 
-                async with session.post(url, json=json_param, timeout=15) as response:
-                    if response.status != 200:
-                        logger.error(f"[AutoSessionWarning] 获取二维码HTTP失败: {response.status}")
-                        return False
+            async with session.post(url, data=_json_dumps(json_param), headers=_JSON_HEADERS) as response:
+                if response.status != 200:
+                    logger.error(f"[AutoSessionWarning] 获取二维码HTTP失败: {response.status}")
+                    return None
                     
-                    result = await response.json()
-                    if result.get("Success"):
-                        data = result.get("Data", {})
-                        qr_url = data.get("QrUrl", "")
-                        uuid = data.get("Uuid", "")
+                result = await response.json(loads=_json_loads)
+                if result.get("Success"):
+                    data = result.get("Data", {})
+                    qr_url = data.get("QrUrl", "")
+                    uuid = data.get("Uuid", "")
                         
-                        if qr_url and uuid:
-                            # 下载并发送二维码图片
-                            qr_image_path = await self._download_qr_image(qr_url, uuid)
-                            if qr_image_path:
-                                success = await self._send_image_message(to_wxid, qr_image_path)
-                                
-                                # 清理临时文件
-                                try:
-                                    if os.path.exists(qr_image_path):
-                                        os.remove(qr_image_path)
-                                except:
-                                    pass
-                                
-                                return success
+                    if qr_url and uuid:
+                        # 下载二维码图片
+                        return await self._download_qr_image(qr_url, uuid)
             
-            return False
+            return None
             
         except Exception as e:
-            logger.error(f"[AutoSessionWarning] 发送登录二维码失败: {e}")
-            return False
+            logger.error(f"[AutoSessionWarning] 获取登录二维码失败: {e}")
+            return None
+    
+    async def _send_qr_image(self, to_wxid: str, qr_image_path: str) -> bool:
+        """发送二维码图片并清理临时文件"""
+        try:
+            return await self._send_image_message(to_wxid, qr_image_path)
+        finally:
+            self._remove_qr_image(qr_image_path)
+    
+    def _remove_qr_image(self, qr_image_path: str):
+        """清理二维码临时文件"""
+        try:
+            if os.path.exists(qr_image_path):
+                os.remove(qr_image_path)
+        except:
+            pass
     
     async def _download_qr_image(self, qr_url: str, uuid: str) -> Optional[str]:
         """下载二维码图片"""
+        image_path = None
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(qr_url, timeout=10) as response:
-                    if response.status == 200:
-                        # 保存到临时文件
-                        temp_dir = os.path.join(
-                            os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 
-                            "tmp"
-                        )
-                        os.makedirs(temp_dir, exist_ok=True)
+            session = await self._get_session()
+            async with session.get(qr_url) as response:
+                if response.status == 200:
+                    # 分块写入临时文件，不在内存中缓存整张图片
+                    image_path = os.path.join(self._tmp_dir, f"qr_{uuid}_{int(time.time())}.png")
                         
-                        image_path = os.path.join(temp_dir, f"qr_{uuid}_{int(time.time())}.png")
+                    with open(image_path, "wb") as f:
+                        async for chunk in response.content.iter_chunked(64 * 1024):
+                            f.write(chunk)
                         
-                        with open(image_path, "wb") as f:
-                            f.write(await response.read())
-                        
-                        logger.info(f"[AutoSessionWarning] 二维码下载成功: {image_path}")
-                        return image_path
+                    logger.info(f"[AutoSessionWarning] 二维码下载成功: {image_path}")
+                    return image_path
             
             return None
             
         except Exception as e:
             logger.error(f"[AutoSessionWarning] 下载二维码图片失败: {e}")
+            if image_path:
+                self._remove_qr_image(image_path)
             return None
     
     async def _send_image_message(self, to_wxid: str, image_path: str) -> bool:
@@ -648,66 +823,84 @@ class AutoSessionWarningPlugin(Plugin):
                 logger.error(f"[AutoSessionWarning] 图片文件不存在: {image_path}")
                 return False
             
-            # 读取图片文件并进行Base64编码
+            # 读取图片文件并进行Base64编码（保持bytes，不再转换为str）
             with open(image_path, "rb") as f:
                 image_data = f.read()
-                image_base64 = base64.b64encode(image_data).decode('utf-8')
+            image_size = len(image_data)
+            image_base64 = base64.b64encode(image_data)
+            del image_data
             
             # 使用正确的API端点和参数格式发送图片
-            async with aiohttp.ClientSession() as session:
-                url = f"{self.base_url}/Msg/UploadImg"
+            session = await self._get_session()
+            url = f"{self.base_url}/Msg/UploadImg"
                 
-                # 使用与wx849_channel.py完全相同的参数格式和顺序
-                json_param = {
-                    "ToWxid": to_wxid,            # 接收者在前
-                    "Base64": image_base64,       # Base64在中间  
-                    "Wxid": self.current_wxid     # 发送者在后
-                }
+            # 使用与wx849_channel.py完全相同的参数格式和顺序
+            # 接口只接受JSON格式的Base64；Base64内容均为ASCII字符，直接拼入请求体，避免整段再序列化
+            body = b"".join((
+                b'{"ToWxid": ', _json_dumps(to_wxid),             # 接收者在前
+                b', "Base64": "', image_base64,                  # Base64在中间
+                b'", "Wxid": ', _json_dumps(self.current_wxid),   # 发送者在后
+                b'}',
+            ))
+            del image_base64
                 
-                logger.debug(f"[AutoSessionWarning] 图片上传请求: URL={url}")
-                logger.debug(f"[AutoSessionWarning] 图片大小: {len(image_data)} bytes")
-                logger.debug(f"[AutoSessionWarning] 参数: Wxid={self.current_wxid}, ToWxid={to_wxid}")
+            logger.debug(f"[AutoSessionWarning] 图片上传请求: URL={url}")
+            logger.debug(f"[AutoSessionWarning] 图片大小: {image_size} bytes")
+            logger.debug(f"[AutoSessionWarning] 参数: Wxid={self.current_wxid}, ToWxid={to_wxid}")
                 
-                # 使用json=json_param格式，与成功的实现一致
-                async with session.post(url, json=json_param, timeout=30) as response:
-                    if response.status != 200:
-                        logger.error(f"[AutoSessionWarning] 发送图片HTTP失败: {response.status}")
-                        return False
+            async with session.post(url, data=body, headers=_JSON_HEADERS) as response:
+                if response.status != 200:
+                    logger.error(f"[AutoSessionWarning] 发送图片HTTP失败: {response.status}")
+                    return False
                     
-                    try:
-                        result = await response.json()
-                        logger.debug(f"[AutoSessionWarning] 图片上传响应: {result}")
+                try:
+                    result = await response.json(loads=_json_loads)
+                    logger.debug(f"[AutoSessionWarning] 图片上传响应: {result}")
                         
-                        if result.get("Success"):
-                            logger.info("[AutoSessionWarning] 图片消息发送成功")
-                            return True
-                        else:
-                            error_msg = result.get("Message", "未知错误")
-                            logger.error(f"[AutoSessionWarning] 图片消息发送失败: {error_msg}")
-                            return False
-                    except json.JSONDecodeError as e:
-                        response_text = await response.text()
-                        logger.error(f"[AutoSessionWarning] 图片消息响应解析失败: {e}")
-                        logger.error(f"[AutoSessionWarning] 响应内容: {response_text}")
+                    if result.get("Success"):
+                        logger.info("[AutoSessionWarning] 图片消息发送成功")
+                        return True
+                    else:
+                        error_msg = result.get("Message", "未知错误")
+                        logger.error(f"[AutoSessionWarning] 图片消息发送失败: {error_msg}")
                         return False
+                except json.JSONDecodeError as e:
+                    response_text = await response.text()
+                    logger.error(f"[AutoSessionWarning] 图片消息响应解析失败: {e}")
+                    logger.error(f"[AutoSessionWarning] 响应内容: {response_text}")
+                    return False
             
         except Exception as e:
-            logger.error(f"[AutoSessionWarning] 发送图片消息异常: {e}")
-            import traceback
-            logger.error(f"[AutoSessionWarning] 异常详情: {traceback.format_exc()}")
+            logger.exception(f"[AutoSessionWarning] 发送图片消息异常: {e}")
             return False
     
     def _create_device_id(self) -> str:
         """生成设备ID"""
-        s = ''.join(random.choice(string.ascii_letters) for _ in range(15))
-        md5_hash = hashlib.md5(s.encode()).hexdigest()
-        return "49" + md5_hash[2:]
+        return "49" + secrets.token_hex(15)
     
     def _create_device_name(self) -> str:
         """生成设备名称"""
-        first_names = ["Alice", "Bob", "Charlie", "Diana", "Edward", "Fiona"]
-        last_names = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia"]
-        return random.choice(first_names) + " " + random.choice(last_names) + "'s iPad"
+        return random.choice(_DEVICE_NAMES)
+    
+    def _ensure_loop_thread(self) -> AsyncEventLoopThread:
+        """获取持久事件循环线程，不存在时创建并启动"""
+        if self._loop_thread is None or not self._loop_thread.is_alive():
+            self._loop_thread = AsyncEventLoopThread()
+            self._loop_thread.start()
+        return self._loop_thread
+    
+    def _shutdown_loop_thread(self):
+        """关闭共享HTTP会话并停止事件循环线程（仅在插件销毁时调用）"""
+        loop_thread = self._loop_thread
+        self._loop_thread = None
+        self._config_flush_handle = None
+        if loop_thread is None or not loop_thread.is_alive():
+            return
+        try:
+            loop_thread.submit(self._close_session()).result(timeout=5)
+        except Exception as e:
+            logger.warning(f"[AutoSessionWarning] 关闭HTTP会话失败: {e}")
+        loop_thread.stop()
     
     def _start_background_check(self):
         """启动后台检查"""
@@ -715,36 +908,56 @@ class AutoSessionWarningPlugin(Plugin):
             return
         
         self.is_running = True
-        self.background_thread = threading.Thread(target=self._background_check_loop, daemon=True)
-        self.background_thread.start()
+        loop_thread = self._ensure_loop_thread()
+        # asyncio.Event需在事件循环线程内创建
+        self._stop_event = loop_thread.submit(self._create_stop_event()).result(timeout=5)
+        self.background_task = loop_thread.submit(self._background_check_loop())
         logger.info("[AutoSessionWarning] 后台预警检查已启动")
     
     def _stop_background_check(self):
         """停止后台检查"""
         self.is_running = False
-        if self.background_thread and self.background_thread.is_alive():
-            self.background_thread.join(timeout=5)
+        loop_thread = self._loop_thread
+        if self._stop_event is not None and loop_thread is not None and loop_thread.is_alive():
+            loop_thread.loop.call_soon_threadsafe(self._stop_event.set)
+        if self.background_task is not None and not self.background_task.done():
+            try:
+                self.background_task.result(timeout=5)
+            except Exception:
+                self.background_task.cancel()
+        self.background_task = None
+        self._stop_event = None
+        self._flush_config()
         logger.info("[AutoSessionWarning] 后台预警检查已停止")
     
-    def _background_check_loop(self):
+    async def _create_stop_event(self) -> asyncio.Event:
+        """在事件循环内创建停止事件"""
+        return asyncio.Event()
+    
+    async def _wait_for_stop(self, stop_event: asyncio.Event, timeout: float):
+        """等待停止信号，最多等待timeout秒"""
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+    
+    async def _background_check_loop(self):
         """后台检查循环"""
-        logger.info("[AutoSessionWarning] 后台预警检查线程已启动")
+        logger.info("[AutoSessionWarning] 后台预警检查任务已启动")
+        stop_event = self._stop_event
         
-        while self.is_running:
+        while not stop_event.is_set():
             try:
                 # 检查是否需要发送预警
                 if self._should_send_warning():
-                    asyncio.run(self._send_auto_warning())
+                    await self._send_auto_warning()
                 
-                # 等待检查间隔
-                for _ in range(int(self.check_interval_hours * 3600)):
-                    if not self.is_running:
-                        break
-                    time.sleep(1)
+                # 等待检查间隔，收到停止信号时立即返回
+                await self._wait_for_stop(stop_event, self.check_interval_hours * 3600)
                     
             except Exception as e:
                 logger.error(f"[AutoSessionWarning] 后台检查循环异常: {e}")
-                time.sleep(60)  # 出错后等待1分钟
+                await self._wait_for_stop(stop_event, 60)  # 出错后等待1分钟
     
     def _should_send_warning(self) -> bool:
         """判断是否应该发送预警"""
@@ -752,26 +965,23 @@ class AutoSessionWarningPlugin(Plugin):
             if not self.warning_enabled or not self.warning_target:
                 return False
             
-            # 获取登录时间
-            login_time = self._get_real_login_time()
-            if not login_time:
+            # 检查是否已经发送过预警（避免重复发送，至少间隔1小时），无需读取文件
+            if (self.last_warning_time is not None
+                    and time.monotonic() - self.last_warning_time < 3600):
+                return False
+            
+            # 获取登录时间戳（文件未变化时直接使用缓存）
+            login_ts = self._get_login_timestamp()
+            if not login_ts:
                 return False
             
             # 计算在线时长
-            now = datetime.now()
-            online_duration = now - login_time
-            online_hours = online_duration.total_seconds() / 3600
+            online_hours = (time.time() - login_ts) / 3600
             
             # 检查是否达到预警阈值
             trigger_hours = self.session_duration_hours - self.warning_threshold
             
-            if online_hours >= trigger_hours:
-                # 检查是否已经发送过预警（避免重复发送）
-                current_time = time.time()
-                if current_time - self.last_warning_time > 3600:  # 至少间隔1小时
-                    return True
-            
-            return False
+            return online_hours >= trigger_hours
             
         except Exception as e:
             logger.error(f"[AutoSessionWarning] 检查预警条件失败: {e}")
@@ -780,10 +990,8 @@ class AutoSessionWarningPlugin(Plugin):
     async def _send_auto_warning(self):
         """发送自动预警"""
         try:
-            self._load_current_login_info()
-            
-            # 获取登录时间和计算在线时长
-            login_time = self._get_real_login_time()
+            # 获取登录信息和登录时间，计算在线时长
+            _, _, login_time = self._refresh_login_state()
             if not login_time:
                 return
             
@@ -801,17 +1009,20 @@ class AutoSessionWarningPlugin(Plugin):
                 f"稍后将为您发送登录二维码。"
             )
             
+            # 二维码生成不依赖文本消息结果，与文本消息并发进行
+            qr_task = asyncio.create_task(self._prepare_qr_image())
+            
             # 发送文本消息
             text_success = await self._send_text_message(self.warning_target, warning_text)
+            qr_image_path = await qr_task
             
             if text_success:
                 logger.info("[AutoSessionWarning] 自动预警文本消息发送成功")
                 
-                # 等待1秒后发送二维码
-                await asyncio.sleep(1)
-                
-                # 发送二维码
-                qr_success = await self._send_login_qr_code(self.warning_target)
+                # 文本消息发送完成后再发送二维码，保证消息顺序
+                qr_success = False
+                if qr_image_path:
+                    qr_success = await self._send_qr_image(self.warning_target, qr_image_path)
                 
                 if qr_success:
                     logger.info("[AutoSessionWarning] 自动预警二维码发送成功")
@@ -819,9 +1030,11 @@ class AutoSessionWarningPlugin(Plugin):
                     logger.warning("[AutoSessionWarning] 自动预警二维码发送失败")
                 
                 # 更新最后预警时间
-                self.last_warning_time = time.time()
+                self.last_warning_time = time.monotonic()
             else:
                 logger.error("[AutoSessionWarning] 自动预警文本消息发送失败")
+                if qr_image_path:
+                    self._remove_qr_image(qr_image_path)
                 
         except Exception as e:
             logger.error(f"[AutoSessionWarning] 发送自动预警失败: {e}")
@@ -832,20 +1045,20 @@ class AutoSessionWarningPlugin(Plugin):
             if not self.current_wxid:
                 self._load_current_login_info()
             
-            async with aiohttp.ClientSession() as session:
-                url = f"{self.base_url}/Msg/SendTxt"
-                json_param = {
-                    "Wxid": self.current_wxid,
-                    "ToWxid": to_wxid,
-                    "Content": content,
-                    "Type": 1,
-                    "At": ""
-                }
+            session = await self._get_session()
+            url = f"{self.base_url}/Msg/SendTxt"
+            json_param = {
+                "Wxid": self.current_wxid,
+                "ToWxid": to_wxid,
+                "Content": content,
+                "Type": 1,
+                "At": ""
+            }
                 
-                async with session.post(url, json=json_param, timeout=10) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return result.get("Success", False)
+            async with session.post(url, data=_json_dumps(json_param), headers=_JSON_HEADERS) as response:
+                if response.status == 200:
+                    result = await response.json(loads=_json_loads)
+                    return result.get("Success", False)
             
             return False
             
@@ -881,9 +1094,11 @@ class AutoSessionWarningPlugin(Plugin):
         self._stop_background_check()
         
         # 重新加载配置
-        self.config = super().load_config()
-        if not self.config:
-            self.config = self._load_default_config()
+        config = super().load_config()
+        if not config:
+            config = self._load_default_config()
+        with self._config_lock:
+            self.config = config
         
         # 更新配置变量
         self.warning_enabled = self.config.get("auto_session_warning_enabled", True)
@@ -900,5 +1115,6 @@ class AutoSessionWarningPlugin(Plugin):
         """析构函数"""
         try:
             self._stop_background_check()
+            self._shutdown_loop_thread()
         except:
             pass 